@@ -51,12 +51,20 @@ def convert_qrels(raw_dir, out_dir, dataset):
     else:
         raise FileNotFoundError(f"No qrels file found in {qrels_dir}")
 
-    out_path = os.path.join(out_dir, "qrels.jsonl")
+    write_qrels(qrels_file, os.path.join(out_dir, "qrels.jsonl"), dataset)
 
+    # train split (if any) is kept separately, e.g. for calibrating routing thresholds
+    # on queries disjoint from the evaluation qrels
+    train_file = os.path.join(qrels_dir, "train.tsv")
+    if os.path.exists(train_file):
+        write_qrels(train_file, os.path.join(out_dir, "qrels_train.jsonl"), dataset)
+
+
+def write_qrels(qrels_file, out_path, dataset):
     with open(qrels_file, "r", encoding="utf-8") as fin, \
          open(out_path, "w", encoding="utf-8") as fout:
         reader = csv.DictReader(fin, delimiter="\t")
-        for row in tqdm(reader, desc=f"[{dataset}] Converting qrels"):
+        for row in tqdm(reader, desc=f"[{dataset}] Converting qrels ({os.path.basename(qrels_file)})"):
             out = {
                 "qid": row["query-id"],
                 "doc_id": row["corpus-id"],
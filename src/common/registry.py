@@ -0,0 +1,214 @@
+import gc
+from collections import OrderedDict
+
+from src.common.sizing import dict_nbytes
+
+
+class ModelRegistry:
+    """
+    One loaded model per (kind, name), shared by every retriever / reranker.
+    Models are never evicted: there are only a handful and they are small next to the indexes.
+    """
+    def __init__(self):
+        self.models = {}
+
+    def get(self, kind: str, name: str):
+        key = (kind, name)
+        if key not in self.models:
+            if kind == "sentence_transformer":
+                from sentence_transformers import SentenceTransformer
+                self.models[key] = SentenceTransformer(name)
+            elif kind == "cross_encoder":
+                from sentence_transformers import CrossEncoder
+                self.models[key] = CrossEncoder(name)
+            else:
+                raise ValueError(f"Unsupported model kind: {kind}")
+        return self.models[key]
+
+
+def resource_nbytes(obj):
+    """Measured in-memory size of a loaded resource (legs, shard clusters, rerankers, doc texts)."""
+    if isinstance(obj, dict):
+        return dict_nbytes(obj)
+    return int(obj.nbytes())
+
+
+class IndexRegistry:
+    """
+    Serve several datasets / methods from one process.
+
+    configs: dict name -> config (name is usually the config file stem, e.g. "hybrid_a08").
+    Requests are routed by their `dataset` field, plus an optional `method` naming one of
+    that dataset's configs (default: the first one registered for the dataset).
+
+    Resources are keyed by what is loaded (FAISS index + store, BM25 pickle, shard dir,
+    docs file, reranker), so e.g. hybrid_a08 and rrf on scifact share one FAISS index and
+    one BM25 model. After each config is built, whole built configs are evicted, least
+    recently used first, until the measured size of the resources they hold (models
+    excluded) fits memory_budget_mb; a resource is freed once no built config uses it.
+    """
+    def __init__(self, configs: dict, memory_budget_mb: float = None, models: ModelRegistry = None):
+        self.configs = {}
+        self.by_dataset = {}
+        for name, cfg in configs.items():
+            dataset = cfg.get("dataset")
+            if not dataset:
+                raise ValueError(f"config {name} needs a `dataset` field to be registered")
+            self.configs[name] = cfg
+            self.by_dataset.setdefault(dataset, []).append(name)
+
+        self.budget_bytes = None if memory_budget_mb is None else int(float(memory_budget_mb) * 2**20)
+        self.models = models if models is not None else ModelRegistry()
+
+        self.resources = {}  # key -> {"obj", "bytes"}, shared by the built configs using it
+        self.resident_bytes = 0
+        # config name -> built retriever / reranker + resource keys it uses; least recently used first
+        self.entries = OrderedDict()
+        self._building = None
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0}
+
+    def _resource(self, key: tuple, loader):
+        # budget is enforced once per built config (see get), never mid-build
+        if self._building is not None:
+            self._building.add(key)
+        if key in self.resources:
+            return self.resources[key]["obj"]
+
+        obj = loader()
+        nbytes = resource_nbytes(obj)
+        self.resources[key] = {"obj": obj, "bytes": nbytes}
+        self.resident_bytes += nbytes
+        self.stats["loads"] += 1
+        return obj
+
+    def _free(self, key: tuple):
+        res = self.resources.pop(key)
+        self.resident_bytes -= res["bytes"]
+        # sharded clusters own worker processes
+        if hasattr(res["obj"], "scatter_gather"):
+            res["obj"].close()
+
+    def evict(self, name: str):
+        """Drop a built config and every resource no other built config still uses."""
+        entry = self.entries.pop(name)
+        self.stats["evictions"] += 1
+        still_used = set().union(*(e["deps"] for e in self.entries.values()))
+        for key in entry["deps"]:
+            if key in self.resources and key not in still_used:
+                self._free(key)
+        del entry
+        gc.collect()
+
+    def _enforce_budget(self, keep: str):
+        if self.budget_bytes is None:
+            return
+        # whole configs go, least recently used first; `keep` may exceed the budget alone
+        for name in list(self.entries.keys()):
+            if self.resident_bytes <= self.budget_bytes:
+                break
+            if name != keep:
+                self.evict(name)
+
+    def _build(self, name: str):
+        from src.run_retrieval import (
+            build_retriever, build_reranker, load_doc_texts, parse_rerank_params,
+        )
+
+        cfg = self.configs[name]
+        r_cfg = cfg["retrieval"]
+        top_k = int(r_cfg.get("top_k", 100))
+        entry = {
+            "retriever": build_retriever(r_cfg, models=self.models, legs=self._resource),
+            "top_k": top_k,
+            "reranker": None,
+            "doc_texts": None,
+            "rerank_params": None,
+        }
+
+        rerank_cfg = cfg.get("rerank", {}) or {}
+        if rerank_cfg.get("enabled", False):
+            docs_path = rerank_cfg["docs_path"]
+            max_doc_chars = rerank_cfg.get("max_doc_chars", None)
+            doc_texts = self._resource(
+                ("docs", docs_path, max_doc_chars),
+                lambda: load_doc_texts(docs_path, max_doc_chars=max_doc_chars),
+            )
+            reranker_key = (
+                "reranker",
+                rerank_cfg.get("model_name", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+                docs_path,
+                max_doc_chars,
+                bool(rerank_cfg.get("pretokenize", False)),
+                rerank_cfg.get("token_cache_path"),
+                int(rerank_cfg.get("batch_size", 32)),
+            )
+            entry["doc_texts"] = doc_texts
+            entry["reranker"] = self._resource(
+                reranker_key, lambda: build_reranker(rerank_cfg, doc_texts=doc_texts, models=self.models)
+            )
+            entry["rerank_params"] = parse_rerank_params(rerank_cfg, top_k)
+        return entry
+
+    def resolve(self, dataset: str, method: str = None):
+        """(dataset, optional method / config name) -> config name"""
+        if dataset not in self.by_dataset:
+            raise KeyError(f"Unknown dataset: {dataset}")
+        if method is None:
+            return self.by_dataset[dataset][0]
+        if method not in self.by_dataset[dataset]:
+            raise KeyError(f"Unknown method for dataset {dataset}: {method}")
+        return method
+
+    def get(self, dataset: str, method: str = None):
+        name = self.resolve(dataset, method)
+
+        if name in self.entries:
+            self.entries.move_to_end(name)
+            self.stats["hits"] += 1
+            return self.entries[name]
+
+        self._building = set()
+        try:
+            entry = self._build(name)
+            entry["deps"] = self._building
+        except Exception:
+            # free what this failed build loaded and nobody else uses
+            still_used = set().union(*(e["deps"] for e in self.entries.values()))
+            for key in self._building - still_used:
+                if key in self.resources:
+                    self._free(key)
+            raise
+        finally:
+            self._building = None
+        self.entries[name] = entry
+        self._enforce_budget(keep=name)
+        return entry
+
+    def search(self, request: dict):
+        """
+        request: {"dataset": ..., "query": ..., optional "method": ..., optional "top_k": ...}
+        -> ranked results
+        """
+        from src.run_retrieval import rerank_results
+
+        entry = self.get(request["dataset"], request.get("method"))
+        results = entry["retriever"].search(request["query"], top_k=entry["top_k"])
+        if entry["reranker"] is not None:
+            results = rerank_results(
+                request["query"], results, entry["reranker"], entry["doc_texts"], **entry["rerank_params"]
+            )
+        return results[: int(request.get("top_k", len(results)))]
+
+    def summary(self):
+        return {
+            **self.stats,
+            "configs": {d: names for d, names in self.by_dataset.items()},
+            "built": list(self.entries.keys()),
+            "resident": [
+                {"key": list(map(str, key)), "mb": res["bytes"] / 2**20}
+                for key, res in self.resources.items()
+            ],
+            "resident_mb": self.resident_bytes / 2**20,
+            "budget_mb": None if self.budget_bytes is None else self.budget_bytes / 2**20,
+            "models": [f"{kind}:{name}" for kind, name in self.models.models.keys()],
+        }
@@ -0,0 +1,36 @@
+import sys
+
+
+def dict_nbytes(d):
+    """Python heap size of a flat dict (table + keys + values)."""
+    return sys.getsizeof(d) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in d.items())
+
+
+def sampled_nbytes(seq, item_nbytes, sample: int = 2000):
+    """Size of a list: container + items, extrapolated from an evenly spaced sample."""
+    n = len(seq)
+    if n == 0:
+        return sys.getsizeof(seq)
+    items = seq[::max(1, n // sample)]
+    return int(sys.getsizeof(seq) + n * sum(item_nbytes(x) for x in items) / len(items))
+
+
+def faiss_nbytes(index):
+    """Stored vector codes of a FAISS index (ntotal * d * 4 for a flat float index)."""
+    try:
+        code_size = index.sa_code_size()
+    except RuntimeError:
+        code_size = index.d * 4
+    return int(index.ntotal * code_size)
+
+
+def bm25_nbytes(bm25, doc_ids=()):
+    """
+    Resident size of a rank_bm25 model: per-doc term-frequency dicts dominate and are
+    several times larger than their pickle, so they are measured, not taken from disk.
+    """
+    total = sampled_nbytes(bm25.doc_freqs, dict_nbytes)
+    total += dict_nbytes(bm25.idf)
+    total += sampled_nbytes(bm25.doc_len, sys.getsizeof)
+    total += sampled_nbytes(doc_ids, sys.getsizeof)
+    return int(total)
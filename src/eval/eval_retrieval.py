@@ -95,6 +95,12 @@ def main():
         default=1,
         help="Minimum relevance to be treated as relevant (default=1). For TREC-COVID, try 2.",
     )
+    ap.add_argument(
+        "--routing",
+        required=False,
+        default=None,
+        help="Optional <run>.routing.json from a routed run; adds legs skipped / latency to metrics",
+    )
     ap.add_argument("--out", required=False, default=None, help="Output metrics json path")
     args = ap.parse_args()
 
@@ -132,6 +138,17 @@ def main():
     metrics["num_qrels_queries"] = len(qrels_qids)
     metrics["num_run_queries"] = len(run_qids)
 
+    if args.routing:
+        with open(args.routing, "r", encoding="utf-8") as f:
+            routing = json.load(f)
+        metrics["legs_skipped_frac"] = routing["legs_skipped_frac"]
+        metrics["route_counts"] = routing["route_counts"]
+        metrics["mean_latency_ms"] = routing["mean_latency_ms"]
+        if routing.get("calibration"):
+            metrics["full_legs_latency_ms"] = routing.get("full_legs_latency_ms")
+            metrics["expected_overlap"] = routing["calibration"]["expected_overlap"]
+            metrics["recall_budget"] = routing["calibration"]["recall_budget"]
+
     print("Metrics:")
     for k in ks:
         print(f"  Recall@{k}: {metrics[f'Recall@{k}']}")
@@ -139,6 +156,12 @@ def main():
     print(f"  min_rel: {metrics['min_rel']}")
     print(f"  num_qrels_queries: {metrics['num_qrels_queries']}")
     print(f"  num_run_queries: {metrics['num_run_queries']}")
+    if args.routing:
+        print(f"  legs_skipped_frac: {metrics['legs_skipped_frac']}")
+        print(f"  route_counts: {metrics['route_counts']}")
+        print(f"  mean_latency_ms: {metrics['mean_latency_ms']}")
+        if "full_legs_latency_ms" in metrics:
+            print(f"  full_legs_latency_ms: {metrics['full_legs_latency_ms']}")
 
     if args.out:
         out_dir = os.path.dirname(args.out)
@@ -0,0 +1,189 @@
+import os
+import json
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.eval.eval_retrieval import load_qrels, load_run, recall_at_k, mrr_at_k
+
+
+def metric_fn(name: str):
+    """ "Recall@10" / "MRR@10" -> fn(rel_set, ranked_list) """
+    base, k = name.split("@")
+    k = int(k)
+    if base.lower() == "recall":
+        return lambda rel_set, ranked: recall_at_k(rel_set, ranked, k)
+    if base.lower() == "mrr":
+        return lambda rel_set, ranked: mrr_at_k(rel_set, ranked, k)
+    raise ValueError(f"Unsupported metric: {name}")
+
+
+def per_query_matrix(qrels, runs, metric: str):
+    """
+    qrels: dict[qid] -> set(doc_id), runs: list of dict[qid] -> ranked doc_ids
+    Returns (qids, matrix[num_queries, num_runs]). Queries without relevant docs are
+    skipped (as in eval_retrieval); queries missing from a run score 0.
+    """
+    fn = metric_fn(metric)
+    qids = sorted(q for q, rel in qrels.items() if rel)
+    mat = np.zeros((len(qids), len(runs)), dtype=np.float64)
+    for i, qid in enumerate(qids):
+        for j, run in enumerate(runs):
+            mat[i, j] = fn(qrels[qid], run.get(qid, []))
+    return qids, mat
+
+
+def _resample_chunk(diffs, n_samples: int, seed):
+    """
+    diffs: [num_queries, num_pairs] per-query paired differences.
+    Returns (boot_means, perm_means), each [n_samples, num_pairs]. All pairs share the
+    same resamples, so each draw is one matrix product over every pair at once.
+    """
+    rng = np.random.default_rng(seed)
+    n_q = diffs.shape[0]
+
+    # paired bootstrap: resample queries with replacement (as per-query counts)
+    counts = rng.multinomial(n_q, np.full(n_q, 1.0 / n_q), size=n_samples)
+    boot_means = (counts @ diffs) / n_q
+
+    # paired randomization: randomly swap the two runs per query (= flip diff sign)
+    signs = rng.integers(0, 2, size=(n_samples, n_q), dtype=np.int8) * 2 - 1
+    perm_means = (signs @ diffs) / n_q
+
+    return boot_means, perm_means
+
+
+def paired_tests(mat, n_samples: int = 10000, workers: int = 1, seed: int = 0,
+                 chunk_size: int = 1000, alpha: float = 0.05):
+    """
+    mat: [num_queries, num_runs]. Tests every run pair (i < j) on mean(run_i - run_j).
+    Returns a list of dicts in itertools.combinations order.
+    """
+    if n_samples < 1 or chunk_size < 1:
+        raise ValueError(f"n_samples and chunk_size must be >= 1 (got {n_samples}, {chunk_size})")
+    pairs = list(itertools.combinations(range(mat.shape[1]), 2))
+    if not pairs:
+        return []
+    idx_a = np.array([a for a, _ in pairs])
+    idx_b = np.array([b for _, b in pairs])
+    diffs = mat[:, idx_a] - mat[:, idx_b]
+    observed = diffs.mean(axis=0)
+
+    sizes = [chunk_size] * (n_samples // chunk_size)
+    if n_samples % chunk_size:
+        sizes.append(n_samples % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            chunks = list(ex.map(_resample_chunk, [diffs] * len(sizes), sizes, seeds))
+    else:
+        chunks = [_resample_chunk(diffs, n, s) for n, s in zip(sizes, seeds)]
+
+    boot = np.vstack([c[0] for c in chunks])
+    perm = np.vstack([c[1] for c in chunks])
+
+    ci_lo, ci_hi = np.percentile(boot, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    abs_obs = np.abs(observed)
+    # bootstrap p: shift the bootstrap distribution to the null (mean diff = 0)
+    p_boot = (np.sum(np.abs(boot - observed) >= abs_obs, axis=0) + 1) / (len(boot) + 1)
+    p_perm = (np.sum(np.abs(perm) >= abs_obs, axis=0) + 1) / (len(perm) + 1)
+
+    return [
+        {
+            "a": int(a),
+            "b": int(b),
+            "mean_diff": float(observed[p]),
+            "ci_low": float(ci_lo[p]),
+            "ci_high": float(ci_hi[p]),
+            "p_bootstrap": float(p_boot[p]),
+            "p_randomization": float(p_perm[p]),
+        }
+        for p, (a, b) in enumerate(pairs)
+    ]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--qrels", required=True, help="Path to qrels.jsonl")
+    ap.add_argument(
+        "--runs",
+        nargs="+",
+        required=True,
+        help="Run jsonl paths, optionally as name=path (default name: file stem)",
+    )
+    ap.add_argument("--metrics", nargs="+", default=["MRR@10", "Recall@10", "Recall@100"])
+    ap.add_argument("--min_rel", type=int, default=1, help="See eval_retrieval --min_rel")
+    ap.add_argument("--n_samples", type=int, default=10000, help="Bootstrap / randomization samples")
+    ap.add_argument("--alpha", type=float, default=0.05, help="CI level = 1 - alpha")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--matrix_out", default=None, help="Optional .npz for per-query metric matrices")
+    ap.add_argument("--out", required=True, help="Output significance json path")
+    args = ap.parse_args()
+    if args.n_samples < 1:
+        ap.error("--n_samples must be >= 1")
+
+    names, runs = [], []
+    for spec in args.runs:
+        name, path = spec.split("=", 1) if "=" in spec else (None, spec)
+        names.append(name or os.path.splitext(os.path.basename(path))[0])
+        runs.append(load_run(path))
+
+    qrels = load_qrels(args.qrels, min_rel=args.min_rel)
+
+    report = {
+        "runs": names,
+        "min_rel": args.min_rel,
+        "n_samples": args.n_samples,
+        "alpha": args.alpha,
+        "seed": args.seed,
+        "metrics": {},
+    }
+    matrices = {}
+
+    for metric in args.metrics:
+        qids, mat = per_query_matrix(qrels, runs, metric)
+        matrices[metric] = mat
+        tests = paired_tests(
+            mat, n_samples=args.n_samples, workers=args.workers, seed=args.seed, alpha=args.alpha
+        )
+        for t in tests:
+            t["a"] = names[t["a"]]
+            t["b"] = names[t["b"]]
+
+        report["metrics"][metric] = {
+            "num_queries": len(qids),
+            "means": {n: float(m) for n, m in zip(names, mat.mean(axis=0))},
+            "pairs": tests,
+        }
+
+        print(f"{metric} ({len(qids)} queries):")
+        for t in tests:
+            print(
+                f"  {t['a']} - {t['b']}: {t['mean_diff']:+.4f} "
+                f"CI[{t['ci_low']:+.4f}, {t['ci_high']:+.4f}] "
+                f"p_boot={t['p_bootstrap']:.4f} p_rand={t['p_randomization']:.4f}"
+            )
+
+    if args.matrix_out:
+        np.savez_compressed(
+            args.matrix_out,
+            qids=np.array(qids),
+            runs=np.array(names),
+            **{m.replace("@", "_at_"): mat for m, mat in matrices.items()},
+        )
+        print(f"Saved per-query matrices to: {args.matrix_out}")
+
+    out_dir = os.path.dirname(args.out)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved significance report to: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
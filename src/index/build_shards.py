@@ -0,0 +1,97 @@
+import os
+import json
+import copy
+import pickle
+import argparse
+
+import faiss
+
+
+def shard_bounds(num_docs: int, num_shards: int):
+    """Split [0, num_docs) into num_shards contiguous doc ranges."""
+    return [
+        (num_docs * i // num_shards, num_docs * (i + 1) // num_shards)
+        for i in range(num_shards)
+    ]
+
+
+def slice_bm25(bm25, lo: int, hi: int):
+    """
+    Restrict a fitted BM25Okapi to docs [lo, hi).
+    idf / avgdl are kept from the full corpus, so shard scores are identical
+    to the scores of the unsharded index.
+    """
+    shard = copy.copy(bm25)
+    shard.doc_freqs = bm25.doc_freqs[lo:hi]
+    shard.doc_len = bm25.doc_len[lo:hi]
+    shard.corpus_size = hi - lo
+    return shard
+
+
+def slice_faiss(index, lo: int, hi: int):
+    """Copy vectors [lo, hi) of a flat FAISS index into a new flat index."""
+    shard = faiss.IndexFlat(index.d, index.metric_type)
+    if hi > lo:
+        shard.add(index.reconstruct_n(lo, hi - lo))
+    return shard
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bm25_index", required=True, help="BM25 index path (pkl)")
+    ap.add_argument("--faiss_index", required=True, help="FAISS index path")
+    ap.add_argument("--store", required=True, help="doc store jsonl path (from build_faiss)")
+    ap.add_argument("--num_shards", type=int, required=True)
+    ap.add_argument("--out_dir", required=True, help="Output dir for shard files + manifest.json")
+    args = ap.parse_args()
+
+    with open(args.bm25_index, "rb") as f:
+        payload = pickle.load(f)
+    bm25_doc_ids = payload["doc_ids"]
+    bm25 = payload["bm25"]
+
+    index = faiss.read_index(args.faiss_index)
+    dense_doc_ids = []
+    with open(args.store, "r", encoding="utf-8") as f:
+        for line in f:
+            dense_doc_ids.append(json.loads(line)["doc_id"])
+
+    # Both indexes are built from the same docs.jsonl, so doc order must agree
+    if bm25_doc_ids != dense_doc_ids:
+        raise ValueError("BM25 and FAISS indexes do not share the same doc order")
+    if index.ntotal != len(dense_doc_ids):
+        raise ValueError(f"FAISS ntotal ({index.ntotal}) != store size ({len(dense_doc_ids)})")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    shards = []
+    for i, (lo, hi) in enumerate(shard_bounds(len(bm25_doc_ids), args.num_shards)):
+        bm25_path = f"shard_{i}.bm25.pkl"
+        faiss_path = f"shard_{i}.faiss.index"
+
+        with open(os.path.join(args.out_dir, bm25_path), "wb") as f:
+            pickle.dump({"doc_ids": bm25_doc_ids[lo:hi], "bm25": slice_bm25(bm25, lo, hi)}, f)
+        faiss.write_index(slice_faiss(index, lo, hi), os.path.join(args.out_dir, faiss_path))
+
+        shards.append({
+            "shard_id": i,
+            "doc_start": lo,
+            "doc_end": hi,
+            "bm25_index_path": bm25_path,
+            "faiss_index_path": faiss_path,
+        })
+        print(f"Shard {i}: docs [{lo}, {hi})")
+
+    manifest = {
+        "num_docs": len(bm25_doc_ids),
+        "num_shards": args.num_shards,
+        "bm25_avgdl": float(bm25.avgdl),
+        "shards": shards,
+    }
+    with open(os.path.join(args.out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    print(f"Saved {args.num_shards} shards to: {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
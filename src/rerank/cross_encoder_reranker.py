@@ -1,18 +1,236 @@
-from typing import List, Tuple
+import os
+import time
+import pickle
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
 from sentence_transformers import CrossEncoder
 
 class CrossEncoderReranker:
-    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size: int = 32):
-        self.model = CrossEncoder(model_name)
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size: int = 32,
+                 doc_texts: Optional[Dict[str, str]] = None, token_cache_path: Optional[str] = None,
+                 model: Optional[CrossEncoder] = None):
+        # model: optional already loaded CrossEncoder (shared via ModelRegistry)
+        self.model = model if model is not None else CrossEncoder(model_name)
+        self.model_name = model_name
         self.batch_size = int(batch_size)
 
+        # Pre-tokenized docs (no special tokens), built once per corpus:
+        # token ids of doc row r are doc_token_ids[doc_offsets[r]:doc_offsets[r + 1]]
+        self.pretokenized = doc_texts is not None
+        self.doc_rows = {}
+        self.doc_token_ids = np.zeros(0, dtype=np.int32)
+        self.doc_offsets = np.zeros(1, dtype=np.int64)
+        self.extra_doc_ids = {}  # docs first seen at query time
+        self.tokenize_time = 0.0
+        self.forward_time = 0.0
+        if self.pretokenized:
+            self._check_pair_template()
+            self._load_or_build_cache(doc_texts, token_cache_path)
+
+    @property
+    def max_length(self) -> int:
+        return int(self.model.max_length or self.model.tokenizer.model_max_length)
+
+    def nbytes(self) -> int:
+        """Token cache arrays + doc_id -> row table; the (shareable) model is not counted."""
+        import sys
+        return int(self.doc_token_ids.nbytes + self.doc_offsets.nbytes + sys.getsizeof(self.doc_rows))
+
+    def _tokenize_docs(self, texts: List[str]):
+        enc = self.model.tokenizer(
+            texts, add_special_tokens=False, truncation=True, max_length=self.max_length
+        )
+        return enc["input_ids"]
+
+    @staticmethod
+    def _corpus_hash(doc_texts: Dict[str, str]) -> str:
+        h = hashlib.sha256()
+        for doc_id, text in doc_texts.items():
+            h.update(doc_id.encode("utf-8"))
+            h.update(b"\0")
+            h.update(text.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _load_or_build_cache(self, doc_texts: Dict[str, str], cache_path: Optional[str]):
+        meta = {
+            "model_name": self.model_name,
+            "max_length": self.max_length,
+            # content hash of the (possibly max_doc_chars-truncated) corpus
+            "corpus_sha256": self._corpus_hash(doc_texts),
+        }
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                payload = pickle.load(f)
+            if payload.get("meta") == meta:
+                self.doc_rows = {doc_id: r for r, doc_id in enumerate(payload["doc_ids"])}
+                self.doc_token_ids = payload["token_ids"]
+                self.doc_offsets = payload["offsets"]
+                return
+            print(f"Token cache {cache_path} was built for another model/corpus, rebuilding")
+
+        doc_ids = list(doc_texts.keys())
+        chunks = []
+        lengths = np.zeros(len(doc_ids), dtype=np.int64)
+        for i in range(0, len(doc_ids), 1024):
+            batch = doc_ids[i:i + 1024]
+            for j, ids in enumerate(self._tokenize_docs([doc_texts[d] for d in batch])):
+                chunks.append(np.asarray(ids, dtype=np.int32))
+                lengths[i + j] = len(ids)
+
+        self.doc_rows = {doc_id: r for r, doc_id in enumerate(doc_ids)}
+        self.doc_token_ids = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int32)
+        self.doc_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+        if cache_path:
+            cache_dir = os.path.dirname(cache_path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            with open(cache_path, "wb") as f:
+                pickle.dump({
+                    "meta": meta,
+                    "doc_ids": doc_ids,
+                    "token_ids": self.doc_token_ids,
+                    "offsets": self.doc_offsets,
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _cached_doc_ids(self, doc_id: str, text: str) -> List[int]:
+        r = self.doc_rows.get(doc_id)
+        if r is not None:
+            return self.doc_token_ids[self.doc_offsets[r]:self.doc_offsets[r + 1]].tolist()
+        ids = self.extra_doc_ids.get(doc_id)
+        if ids is None:
+            ids = self._tokenize_docs([text])[0]
+            self.extra_doc_ids[doc_id] = ids
+        return ids
+
+    def _check_pair_template(self):
+        """
+        Cached inputs are assembled as [CLS] q [SEP] d [SEP] (BERT-style cross-encoders,
+        e.g. ms-marco-MiniLM); refuse tokenizers whose pair template differs.
+        """
+        tok = self.model.tokenizer
+        q = tok("query", add_special_tokens=False)["input_ids"]
+        d = tok("document", add_special_tokens=False)["input_ids"]
+        enc = tok("query", "document")
+        expected = [tok.cls_token_id] + q + [tok.sep_token_id] + d + [tok.sep_token_id]
+        if tok.cls_token_id is None or tok.sep_token_id is None or enc["input_ids"] != expected:
+            raise ValueError(
+                f"rerank.pretokenize supports [CLS] q [SEP] d [SEP] tokenizers only ({self.model_name})"
+            )
+
+    @staticmethod
+    def _truncated_lengths(n_q: int, n_d: int, budget: int):
+        """
+        Pair lengths after truncation="longest_first" as the fast (Rust) tokenizer does it:
+        the shorter sequence is kept if it fits in half the budget, otherwise both are cut
+        to half (odd remainder to the longer one; ties go to the doc).
+        """
+        if n_q + n_d <= budget:
+            return n_q, n_d
+        swap = n_q > n_d
+        n1, n2 = (n_d, n_q) if swap else (n_q, n_d)
+        n2 = n1 if n1 > budget else max(n1, budget - n1)
+        if n1 + n2 > budget:
+            n1 = budget // 2
+            n2 = n1 + budget % 2
+        if swap:
+            n1, n2 = n2, n1
+        return min(n_q, n1), min(n_d, n2)
+
+    def _pair_features(self, q_ids: List[int], d_ids_list: List[List[int]]):
+        """Assemble padded [CLS] q [SEP] d [SEP] inputs from query ids + cached doc ids."""
+        tok = self.model.tokenizer
+        cls_id, sep_id = tok.cls_token_id, tok.sep_token_id
+        budget = self.max_length - 3
+
+        input_ids, token_type_ids = [], []
+        for d_ids in d_ids_list:
+            n_q, n_d = self._truncated_lengths(len(q_ids), len(d_ids), budget)
+            input_ids.append([cls_id] + q_ids[:n_q] + [sep_id] + d_ids[:n_d] + [sep_id])
+            token_type_ids.append([0] * (n_q + 2) + [1] * (n_d + 1))
+
+        max_len = max(len(x) for x in input_ids)
+        pad_id = tok.pad_token_id
+        features = {
+            "input_ids": torch.tensor([x + [pad_id] * (max_len - len(x)) for x in input_ids]),
+            "attention_mask": torch.tensor([[1] * len(x) + [0] * (max_len - len(x)) for x in input_ids]),
+        }
+        if "token_type_ids" in tok.model_input_names:
+            features["token_type_ids"] = torch.tensor(
+                [x + [0] * (max_len - len(x)) for x in token_type_ids]
+            )
+        return features
+
+    def _activation(self):
+        # same activation CrossEncoder.predict applies (e.g. sigmoid for 1-label models)
+        activation = None
+        for attr in ("activation_fn", "activation_fct", "default_activation_function"):
+            activation = activation or getattr(self.model, attr, None)
+        return activation
+
+    def _forward(self, features, activation):
+        hf_model = self.model.model
+        device = next(hf_model.parameters()).device
+
+        t0 = time.perf_counter()
+        features = {k: v.to(device) for k, v in features.items()}
+        hf_model.eval()
+        with torch.no_grad():
+            logits = hf_model(**features, return_dict=True).logits
+            if activation is not None:
+                logits = activation(logits)
+        if logits.shape[-1] == 1:
+            logits = logits[:, 0]
+        scores = logits.float().cpu().tolist()
+        self.forward_time += time.perf_counter() - t0
+        return scores
+
+    def _predict_cached(self, query: str, docs: List[Tuple[str, str]]):
+        t0 = time.perf_counter()
+        q_ids = self.model.tokenizer(query, add_special_tokens=False)["input_ids"]
+        d_ids_list = [self._cached_doc_ids(doc_id, text) for doc_id, text in docs]
+        self.tokenize_time += time.perf_counter() - t0
+
+        activation = self._activation()
+        scores = []
+        for i in range(0, len(d_ids_list), self.batch_size):
+            t0 = time.perf_counter()
+            features = self._pair_features(q_ids, d_ids_list[i:i + self.batch_size])
+            self.tokenize_time += time.perf_counter() - t0
+            scores.extend(self._forward(features, activation))
+        return scores
+
+    def _predict_uncached(self, query: str, docs: List[Tuple[str, str]]):
+        """Tokenize [query, text] pairs the way CrossEncoder.predict does, timed separately."""
+        activation = self._activation()
+        scores = []
+        for i in range(0, len(docs), self.batch_size):
+            texts = [text for _, text in docs[i:i + self.batch_size]]
+            t0 = time.perf_counter()
+            features = self.model.tokenizer(
+                [query] * len(texts), texts,
+                padding=True, truncation="longest_first",
+                max_length=self.max_length, return_tensors="pt",
+            )
+            self.tokenize_time += time.perf_counter() - t0
+            scores.extend(self._forward(dict(features), activation))
+        return scores
+
     def rerank(self, query: str, docs: List[Tuple[str, str]], top_k: int):
         """
         docs: list of (doc_id, doc_text)
         return: list of {"doc_id":..., "score":...} sorted desc
         """
-        pairs = [[query, text] for _, text in docs]
-        scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        if not docs:
+            return []
+        if self.pretokenized:
+            scores = self._predict_cached(query, docs)
+        else:
+            scores = self._predict_uncached(query, docs)
 
         scored = [{"doc_id": doc_id, "score": float(s)} for (doc_id, _), s in zip(docs, scores)]
         scored.sort(key=lambda x: x["score"], reverse=True)
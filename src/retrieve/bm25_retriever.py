@@ -19,3 +19,10 @@ class BM25Retriever:
         top_idx = np.argsort(-scores)[:top_k]
         results = [{"doc_id": self.doc_ids[i], "score": float(scores[i])} for i in top_idx]
         return results
+
+    def nbytes(self):
+        from src.common.sizing import bm25_nbytes
+        return bm25_nbytes(self.bm25, self.doc_ids)
+
+    def search_batch(self, queries, top_k: int = 100):
+        return [self.search(q, top_k=top_k) for q in queries]
@@ -4,9 +4,10 @@ import numpy as np
 from sentence_transformers import SentenceTransformer
 
 class DenseRetriever:
-    def __init__(self, index_path: str, store_path: str, model_name: str):
+    def __init__(self, index_path: str, store_path: str, model_name: str, model=None):
         self.index = faiss.read_index(index_path)
-        self.model = SentenceTransformer(model_name)
+        # model: optional already loaded SentenceTransformer (shared via ModelRegistry)
+        self.model = model if model is not None else SentenceTransformer(model_name)
 
         self.doc_ids = []
         with open(store_path, "r", encoding="utf-8") as f:
@@ -14,12 +15,24 @@ class DenseRetriever:
                 obj = json.loads(line)
                 self.doc_ids.append(obj["doc_id"])
 
+    def nbytes(self):
+        """Index + doc_ids; the (shareable) model is not counted."""
+        import sys
+        from src.common.sizing import faiss_nbytes, sampled_nbytes
+        return faiss_nbytes(self.index) + sampled_nbytes(self.doc_ids, sys.getsizeof)
+
     def search(self, query: str, top_k: int = 100):
-        q_emb = self.model.encode([query], normalize_embeddings=True)
+        return self.search_batch([query], top_k=top_k)[0]
+
+    def search_batch(self, queries, top_k: int = 100):
+        q_emb = self.model.encode(list(queries), normalize_embeddings=True)
         q_emb = np.asarray(q_emb, dtype="float32")
         scores, idx = self.index.search(q_emb, top_k)
 
-        results = []
-        for i, s in zip(idx[0], scores[0]):
-            results.append({"doc_id": self.doc_ids[int(i)], "score": float(s)})
-        return results
+        batch_results = []
+        for row_i, row_s in zip(idx, scores):
+            results = []
+            for i, s in zip(row_i, row_s):
+                results.append({"doc_id": self.doc_ids[int(i)], "score": float(s)})
+            batch_results.append(results)
+        return batch_results
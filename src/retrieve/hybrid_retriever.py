@@ -24,7 +24,14 @@ class HybridRetriever:
     def search(self, query: str, top_k: int = 100, dense_k: int = 200, bm25_k: int = 200):
         dense_res = self.dense.search(query, top_k=dense_k)
         bm25_res = self.bm25.search(query, top_k=bm25_k)
+        return self.fuse(dense_res, bm25_res, top_k=top_k)
 
+    def search_batch(self, queries, top_k: int = 100, dense_k: int = 200, bm25_k: int = 200):
+        dense_batch = self.dense.search_batch(queries, top_k=dense_k)
+        bm25_batch = self.bm25.search_batch(queries, top_k=bm25_k)
+        return [self.fuse(d, b, top_k=top_k) for d, b in zip(dense_batch, bm25_batch)]
+
+    def fuse(self, dense_res, bm25_res, top_k: int = 100):
         dense_norm = self._minmax_norm(dense_res)
         bm25_norm = self._minmax_norm(bm25_res)
 
@@ -0,0 +1,222 @@
+import time
+import itertools
+from collections import defaultdict
+
+import numpy as np
+
+from src.retrieve.bm25_retriever import tokenize
+from src.retrieve.hybrid_retriever import HybridRetriever
+from src.retrieve.rrf_retriever import RRFRetriever
+
+ROUTES = ("both", "dense", "bm25", "shallow")
+
+# threshold values that never trigger their route (stored as null in json)
+DISABLED = {
+    "oov": float("inf"),
+    "idf_mass": float("-inf"),
+    "bm25": float("inf"),
+    "q_len": float("inf"),
+    "shallow": float("inf"),
+}
+
+
+class RoutedRetriever:
+    """
+    Query-adaptive routing on top of a HybridRetriever / RRFRetriever.
+    Per query, cheap signals decide which legs actually run:
+      - before any leg: query length, OOV rate and IDF mass against the BM25 vocab
+        -> "dense" (skip BM25) if oov_rate >= oov or idf_mass < idf_mass
+      - after BM25: bm25_conf = top1 score / max attainable score ((k1 + 1) * idf_mass)
+        -> "bm25" (skip dense) if bm25_conf >= bm25 and q_len <= q_len
+        -> "shallow" (dense at shallow_k) if bm25_conf >= shallow
+        -> "both" otherwise
+    Thresholds are calibrated so that the routed top overlap_k keeps at least
+    recall_budget of the full (both legs) top overlap_k on calibration queries.
+    """
+    def __init__(self, fusion_retriever, recall_budget: float = 0.95, leg_k: int = 200,
+                 shallow_k: int = 50, overlap_k: int = 10, thresholds: dict = None):
+        if isinstance(fusion_retriever, HybridRetriever):
+            self.dense = fusion_retriever.dense
+            self.bm25 = fusion_retriever.bm25
+            self._fuse = fusion_retriever.fuse
+        elif isinstance(fusion_retriever, RRFRetriever):
+            self.dense, self.bm25 = fusion_retriever.retrievers
+            self._fuse = lambda d, b, top_k: fusion_retriever.fuse([d, b], top_k=top_k)
+        else:
+            raise ValueError("routing supports hybrid and rrf retrievers only")
+        if not hasattr(self.bm25, "bm25"):
+            raise ValueError("routing needs a local BM25Retriever (for its vocabulary / idf)")
+
+        self.recall_budget = float(recall_budget)
+        self.leg_k = int(leg_k)
+        self.shallow_k = int(shallow_k)
+        self.overlap_k = int(overlap_k)
+
+        # default: never skip anything until calibrated
+        self.thresholds = dict(DISABLED)
+        if thresholds:
+            self.set_thresholds(thresholds)
+
+        self.calibration = None
+        self.route_counts = defaultdict(int)
+        self.route_latency = defaultdict(float)
+
+    def set_thresholds(self, thresholds: dict):
+        """Update from a config / json dict; None (null) disables that route."""
+        for k, v in thresholds.items():
+            self.thresholds[k] = DISABLED[k] if v is None else float(v)
+
+    def thresholds_json(self):
+        """Thresholds with disabled (infinite) values as None, so json.dump writes valid JSON."""
+        return {k: None if np.isinf(v) else v for k, v in self.thresholds.items()}
+
+    def query_signals(self, query: str):
+        q_tokens = tokenize(query)
+        idf = self.bm25.bm25.idf
+        in_vocab = [t for t in q_tokens if t in idf]
+        oov_rate = 1.0 - len(in_vocab) / len(q_tokens) if q_tokens else 1.0
+        idf_mass = float(sum(idf[t] for t in in_vocab))
+        return {"q_len": len(q_tokens), "oov_rate": oov_rate, "idf_mass": idf_mass}
+
+    def bm25_confidence(self, bm25_res, idf_mass: float):
+        if not bm25_res or idf_mass <= 0:
+            return 0.0
+        upper = (self.bm25.bm25.k1 + 1.0) * idf_mass
+        return float(bm25_res[0]["score"]) / upper
+
+    def search(self, query: str, top_k: int = 100):
+        t0 = time.perf_counter()
+        th = self.thresholds
+        sig = self.query_signals(query)
+
+        if sig["oov_rate"] >= th["oov"] or sig["idf_mass"] < th["idf_mass"]:
+            route = "dense"
+            results = self._fuse(self.dense.search(query, top_k=self.leg_k), [], top_k)
+        else:
+            bm25_res = self.bm25.search(query, top_k=self.leg_k)
+            conf = self.bm25_confidence(bm25_res, sig["idf_mass"])
+            if conf >= th["bm25"] and sig["q_len"] <= th["q_len"]:
+                route = "bm25"
+                results = self._fuse([], bm25_res, top_k)
+            else:
+                route = "shallow" if conf >= th["shallow"] else "both"
+                dense_k = self.shallow_k if route == "shallow" else self.leg_k
+                results = self._fuse(self.dense.search(query, top_k=dense_k), bm25_res, top_k)
+
+        self.route_counts[route] += 1
+        self.route_latency[route] += time.perf_counter() - t0
+        return results
+
+    @staticmethod
+    def _overlap(full, routed, k: int):
+        full_ids = {r["doc_id"] for r in full[:k]}
+        if not full_ids:
+            return 1.0
+        return len(full_ids & {r["doc_id"] for r in routed[:k]}) / len(full_ids)
+
+    def calibrate(self, queries):
+        """
+        queries: list of query strings (ideally a dev split, not the eval queries).
+        Runs both legs once per query, simulates every route from those results, then
+        grid-searches thresholds that skip the most legs while keeping mean overlap
+        with the full fused top overlap_k >= recall_budget.
+        """
+        k = self.overlap_k
+        sigs, overlaps = [], []
+        dense_s = bm25_s = 0.0
+
+        for q in queries:
+            sig = self.query_signals(q)
+
+            t0 = time.perf_counter()
+            dense_res = self.dense.search(q, top_k=self.leg_k)
+            t1 = time.perf_counter()
+            bm25_res = self.bm25.search(q, top_k=self.leg_k)
+            t2 = time.perf_counter()
+            dense_s += t1 - t0
+            bm25_s += t2 - t1
+
+            full = self._fuse(dense_res, bm25_res, k)
+            overlaps.append([
+                1.0,
+                self._overlap(full, self._fuse(dense_res, [], k), k),
+                self._overlap(full, self._fuse([], bm25_res, k), k),
+                self._overlap(full, self._fuse(dense_res[: self.shallow_k], bm25_res, k), k),
+            ])
+            sig["bm25_conf"] = self.bm25_confidence(bm25_res, sig["idf_mass"])
+            sigs.append(sig)
+
+        n = len(sigs)
+        if n == 0:
+            raise ValueError("calibration needs at least one query")
+
+        ov = np.asarray(overlaps)
+        oov = np.array([s["oov_rate"] for s in sigs])
+        idfm = np.array([s["idf_mass"] for s in sigs])
+        qlen = np.array([s["q_len"] for s in sigs], dtype=float)
+        conf = np.array([s["bm25_conf"] for s in sigs])
+
+        qs = [0.1, 0.25, 0.5, 0.75, 0.9]
+        grid = {
+            "oov": [float("inf")] + sorted(set(np.quantile(oov, qs[1:]).tolist()) - {0.0}),
+            "idf_mass": [float("-inf")] + np.unique(np.quantile(idfm, qs)).tolist(),
+            "bm25": [float("inf")] + np.unique(np.quantile(conf, qs)).tolist(),
+            "q_len": [float("inf")] + np.unique(np.quantile(qlen, qs)).tolist(),
+            "shallow": [float("inf")] + np.unique(np.quantile(conf, qs)).tolist(),
+        }
+
+        best, best_key = None, None
+        rows = np.arange(n)
+        for t_oov, t_idf, t_bm25, t_len, t_sh in itertools.product(*grid.values()):
+            skip_bm25 = (oov >= t_oov) | (idfm < t_idf)
+            skip_dense = ~skip_bm25 & (conf >= t_bm25) & (qlen <= t_len)
+            shallow = ~skip_bm25 & ~skip_dense & (conf >= t_sh)
+            route_idx = np.select([skip_bm25, skip_dense, shallow], [1, 2, 3], default=0)
+
+            mean_ov = float(ov[rows, route_idx].mean())
+            if mean_ov < self.recall_budget:
+                continue
+            skipped = int(skip_bm25.sum() + skip_dense.sum())
+            key = (skipped, int(shallow.sum()), mean_ov)
+            if best_key is None or key > best_key:
+                best_key = key
+                best = {
+                    "oov": t_oov, "idf_mass": t_idf, "bm25": t_bm25,
+                    "q_len": t_len, "shallow": t_sh,
+                }
+
+        # the all-"both" point always meets the budget, so best is never None
+        self.thresholds = best
+        self.calibration = {
+            "num_queries": n,
+            "recall_budget": self.recall_budget,
+            "overlap_k": k,
+            "expected_overlap": best_key[2],
+            "expected_legs_skipped_frac": best_key[0] / (2.0 * n),
+            "expected_shallow_frac": best_key[1] / float(n),
+            "full_dense_ms": 1000.0 * dense_s / n,
+            "full_bm25_ms": 1000.0 * bm25_s / n,
+        }
+        return self.thresholds
+
+    def routing_summary(self):
+        n = sum(self.route_counts.values())
+        skipped = self.route_counts["dense"] + self.route_counts["bm25"]
+        total_s = sum(self.route_latency.values())
+        summary = {
+            "num_queries": n,
+            "route_counts": {r: self.route_counts[r] for r in ROUTES},
+            "legs_skipped": skipped,
+            "legs_skipped_frac": skipped / (2.0 * n) if n else 0.0,
+            "mean_latency_ms": 1000.0 * total_s / n if n else 0.0,
+            "mean_latency_ms_by_route": {
+                r: 1000.0 * self.route_latency[r] / self.route_counts[r]
+                for r in ROUTES if self.route_counts[r]
+            },
+            "thresholds": self.thresholds_json(),
+            "calibration": self.calibration,
+        }
+        if self.calibration:
+            full_ms = self.calibration["full_dense_ms"] + self.calibration["full_bm25_ms"]
+            summary["full_legs_latency_ms"] = full_ms
+        return summary
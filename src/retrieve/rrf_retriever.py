@@ -9,10 +9,16 @@ class RRFRetriever:
         self.k = int(k)
 
     def search(self, query: str, top_k: int = 100, per_system_k: int = 200):
+        return self.fuse([r.search(query, top_k=per_system_k) for r in self.retrievers], top_k=top_k)
+
+    def search_batch(self, queries, top_k: int = 100, per_system_k: int = 200):
+        per_system = [r.search_batch(queries, top_k=per_system_k) for r in self.retrievers]
+        return [self.fuse(list(lists), top_k=top_k) for lists in zip(*per_system)]
+
+    def fuse(self, result_lists, top_k: int = 100):
         scores = {}
 
-        for r in self.retrievers:
-            res = r.search(query, top_k=per_system_k)
+        for res in result_lists:
             for rank, item in enumerate(res, start=1):
                 doc_id = item["doc_id"]
                 scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (self.k + rank)
@@ -0,0 +1,273 @@
+import os
+import json
+import heapq
+import pickle
+import argparse
+import itertools
+import multiprocessing as mp
+from multiprocessing.connection import Listener, Client
+
+import faiss
+import numpy as np
+
+from src.retrieve.bm25_retriever import tokenize
+
+# Shard connections unpickle what they receive: the key must stay secret and servers
+# should only listen where trusted clients can reach them.
+AUTHKEY_ENV = "RAG_SHARD_AUTHKEY"
+
+
+def resolve_authkey(authkey=None):
+    """authkey from config / CLI, else from $RAG_SHARD_AUTHKEY; None if neither is set."""
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENV)
+    if authkey is None:
+        return None
+    return authkey.encode() if isinstance(authkey, str) else bytes(authkey)
+
+
+class ShardWorker:
+    """
+    Serves one doc-range shard (see src/index/build_shards.py).
+    BM25 shards carry the global idf/avgdl, so scores match the unsharded index.
+    """
+    def __init__(self, shard_dir: str, shard_id: int):
+        with open(os.path.join(shard_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            info = json.load(f)["shards"][shard_id]
+
+        with open(os.path.join(shard_dir, info["bm25_index_path"]), "rb") as f:
+            payload = pickle.load(f)
+        self.doc_ids = payload["doc_ids"]
+        self.bm25 = payload["bm25"]
+        self.index = faiss.read_index(os.path.join(shard_dir, info["faiss_index_path"]))
+
+    def search_bm25(self, q_tokens_batch, top_k: int):
+        out = []
+        for q_tokens in q_tokens_batch:
+            scores = np.asarray(self.bm25.get_scores(q_tokens))
+            top_idx = np.argsort(-scores)[:top_k]
+            out.append([{"doc_id": self.doc_ids[i], "score": float(scores[i])} for i in top_idx])
+        return out
+
+    def search_dense(self, q_embs, top_k: int):
+        k = min(top_k, self.index.ntotal)
+        if k == 0:
+            return [[] for _ in range(len(q_embs))]
+        scores, idx = self.index.search(q_embs, k)
+        return [
+            [{"doc_id": self.doc_ids[int(i)], "score": float(s)} for i, s in zip(row_i, row_s) if i >= 0]
+            for row_i, row_s in zip(idx, scores)
+        ]
+
+    def nbytes(self):
+        from src.common.sizing import bm25_nbytes, faiss_nbytes
+        return bm25_nbytes(self.bm25, self.doc_ids) + faiss_nbytes(self.index)
+
+    def handle(self, msg):
+        op, payload, top_k = msg
+        if op == "nbytes":
+            return self.nbytes()
+        if op == "bm25":
+            return self.search_bm25(payload, top_k)
+        if op == "dense":
+            return self.search_dense(payload, top_k)
+        raise ValueError(f"Unknown shard op: {op}")
+
+
+def _serve_conn(conn, worker: ShardWorker):
+    # Request loop: (op, payload, top_k) -> ("ok", results) | ("error", msg); None = shutdown
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        try:
+            conn.send(("ok", worker.handle(msg)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+    conn.close()
+
+
+def _pipe_worker(conn, shard_dir: str, shard_id: int):
+    _serve_conn(conn, ShardWorker(shard_dir, shard_id))
+
+
+def _socket_worker(ready_conn, shard_dir: str, shard_id: int, host: str, port: int, authkey: bytes):
+    worker = ShardWorker(shard_dir, shard_id)
+    with Listener((host, port), authkey=authkey) as listener:
+        ready_conn.send(listener.address)
+        ready_conn.close()
+        with listener.accept() as conn:
+            _serve_conn(conn, worker)
+
+
+class ShardCluster:
+    """
+    Connections to all shards of one index. Shards are served by:
+      - "process": local worker processes over pipes
+      - "socket":  local worker processes over TCP sockets (stand-in for remote nodes)
+      - "remote":  already running shard servers at `addresses` ("host:port")
+    Each request is sent to every shard before any reply is read, so shards work in parallel.
+    Local socket workers get a random per-cluster authkey; remote needs the servers' key
+    (authkey, or $RAG_SHARD_AUTHKEY).
+    """
+    def __init__(self, shard_dir: str, backend: str = "process", addresses=None, authkey=None):
+        with open(os.path.join(shard_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        num_shards = int(self.manifest["num_shards"])
+
+        self.backend = backend.lower()
+        self.conns = []
+        self.procs = []
+        ctx = mp.get_context("spawn")
+
+        if self.backend == "process":
+            for i in range(num_shards):
+                parent_conn, child_conn = ctx.Pipe()
+                p = ctx.Process(target=_pipe_worker, args=(child_conn, shard_dir, i), daemon=True)
+                p.start()
+                child_conn.close()
+                self.procs.append(p)
+                self.conns.append(parent_conn)
+
+        elif self.backend == "socket":
+            authkey = os.urandom(32)
+            for i in range(num_shards):
+                ready_recv, ready_send = ctx.Pipe(duplex=False)
+                p = ctx.Process(
+                    target=_socket_worker,
+                    args=(ready_send, shard_dir, i, "127.0.0.1", 0, authkey),
+                    daemon=True,
+                )
+                p.start()
+                ready_send.close()
+                address = ready_recv.recv()
+                self.procs.append(p)
+                self.conns.append(Client(address, authkey=authkey))
+
+        elif self.backend == "remote":
+            if not addresses or len(addresses) != num_shards:
+                raise ValueError(f"backend=remote needs one address per shard ({num_shards})")
+            authkey = resolve_authkey(authkey)
+            if authkey is None:
+                raise ValueError(f"backend=remote needs an authkey (retrieval.authkey or ${AUTHKEY_ENV})")
+            for addr in addresses:
+                host, port = addr.rsplit(":", 1)
+                self.conns.append(Client((host, int(port)), authkey=authkey))
+
+        else:
+            raise ValueError("sharded backend must be one of: process, socket, remote")
+
+    @property
+    def num_shards(self):
+        return len(self.conns)
+
+    def _request_all(self, msg):
+        """Send msg to every shard, then read every reply; raise if any shard failed."""
+        if not self.conns:
+            raise RuntimeError("Shard cluster is closed")
+        try:
+            for conn in self.conns:
+                conn.send(msg)
+            # read every reply before raising, so no stale reply is left in a connection
+            replies = [conn.recv() for conn in self.conns]
+        except (OSError, EOFError) as e:
+            # a shard connection broke mid-request: replies can no longer be matched up
+            self.close()
+            raise RuntimeError(f"Shard connection failed, cluster closed: {e}") from e
+
+        errors = [f"shard {i}: {res}" for i, (status, res) in enumerate(replies) if status != "ok"]
+        if errors:
+            raise RuntimeError("Shard error: " + "; ".join(errors))
+        return [res for _, res in replies]
+
+    def nbytes(self):
+        """Measured size of the shards held by local workers; remote shards use no local memory."""
+        if self.backend == "remote":
+            return 0
+        return int(sum(self._request_all(("nbytes", None, 0))))
+
+    def scatter_gather(self, op: str, payload, top_k: int):
+        """
+        Fan out a batch to all shards, merge per-shard top-k lists with a heap.
+        Returns one merged result list per query in the batch.
+        """
+        per_shard = self._request_all((op, payload, top_k))
+
+        merged = []
+        for q_idx in range(len(payload)):
+            # per-shard lists are already sorted desc by score
+            runs = [res[q_idx] for res in per_shard]
+            merged.append(list(itertools.islice(
+                heapq.merge(*runs, key=lambda x: x["score"], reverse=True), top_k
+            )))
+        return merged
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(None)
+                conn.close()
+            except (OSError, EOFError):
+                pass
+        for p in self.procs:
+            p.join(timeout=5)
+        self.conns = []
+        self.procs = []
+
+
+class ShardedBM25Retriever:
+    def __init__(self, cluster: ShardCluster):
+        self.cluster = cluster
+
+    def search_batch(self, queries, top_k: int = 100):
+        return self.cluster.scatter_gather("bm25", [tokenize(q) for q in queries], top_k)
+
+    def search(self, query: str, top_k: int = 100):
+        return self.search_batch([query], top_k=top_k)[0]
+
+
+class ShardedDenseRetriever:
+    """Queries are encoded once here; only the embeddings are sent to the shards."""
+    def __init__(self, cluster: ShardCluster, model_name: str, model=None):
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(model_name)
+        self.cluster = cluster
+        self.model = model
+
+    def search_batch(self, queries, top_k: int = 100):
+        q_embs = self.model.encode(list(queries), normalize_embeddings=True)
+        q_embs = np.asarray(q_embs, dtype="float32")
+        return self.cluster.scatter_gather("dense", q_embs, top_k)
+
+    def search(self, query: str, top_k: int = 100):
+        return self.search_batch([query], top_k=top_k)[0]
+
+
+def main():
+    """Serve one shard over TCP, e.g. on a remote node for backend=remote."""
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--shard_dir", required=True, help="Dir with manifest.json + shard files")
+    ap.add_argument("--shard_id", type=int, required=True)
+    ap.add_argument("--host", default="127.0.0.1", help="Bind address; only expose on a trusted network")
+    ap.add_argument("--port", type=int, required=True)
+    ap.add_argument("--authkey", default=None, help=f"Shared secret (default: ${AUTHKEY_ENV})")
+    args = ap.parse_args()
+
+    authkey = resolve_authkey(args.authkey)
+    if authkey is None:
+        ap.error(f"--authkey or ${AUTHKEY_ENV} is required")
+
+    worker = ShardWorker(args.shard_dir, args.shard_id)
+    print(f"Serving shard {args.shard_id} ({len(worker.doc_ids)} docs) on {args.host}:{args.port}")
+    with Listener((args.host, args.port), authkey=authkey) as listener:
+        while True:
+            with listener.accept() as conn:
+                _serve_conn(conn, worker)
+
+
+if __name__ == "__main__":
+    main()
@@ -33,71 +33,196 @@ def load_doc_texts(docs_path, max_doc_chars=None):
     return doc_map
 
 
-def build_retriever(r_cfg: dict):
+def shared_model(models, kind: str, name: str):
+    """Model from a ModelRegistry if given, else None (the retriever loads its own)."""
+    if models is None:
+        return None
+    return models.get(kind, name)
+
+
+def shared_leg(legs, key: tuple, loader):
+    """Leg from a shared-resource hook (e.g. IndexRegistry) if given, else loaded here."""
+    if legs is None:
+        return loader()
+    return legs(key, loader)
+
+
+def dense_leg(r_cfg: dict, models=None, legs=None):
+    from src.retrieve.dense_retriever import DenseRetriever
+    key = ("dense", r_cfg["faiss_index_path"], r_cfg["store_path"], r_cfg["embedding_model"])
+    return shared_leg(legs, key, lambda: DenseRetriever(
+        index_path=r_cfg["faiss_index_path"],
+        store_path=r_cfg["store_path"],
+        model_name=r_cfg["embedding_model"],
+        model=shared_model(models, "sentence_transformer", r_cfg["embedding_model"]),
+    ))
+
+
+def bm25_leg(r_cfg: dict, legs=None):
+    from src.retrieve.bm25_retriever import BM25Retriever
+    key = ("bm25", r_cfg["bm25_index_path"])
+    return shared_leg(legs, key, lambda: BM25Retriever(r_cfg["bm25_index_path"]))
+
+
+def build_retriever(r_cfg: dict, models=None, calibrate_routing: bool = False, legs=None):
+    """
+    legs: optional hook legs(key, loader) -> leg, so several configs over the same
+    index files share one loaded FAISS index / BM25 model / shard cluster.
+    """
     r_type = r_cfg["type"].lower()
 
     if r_type == "bm25":
-        from src.retrieve.bm25_retriever import BM25Retriever
-        return BM25Retriever(r_cfg["bm25_index_path"])
+        return bm25_leg(r_cfg, legs)
 
     if r_type == "dense":
-        from src.retrieve.dense_retriever import DenseRetriever
-        return DenseRetriever(
-            index_path=r_cfg["faiss_index_path"],
-            store_path=r_cfg["store_path"],
-            model_name=r_cfg["embedding_model"],
-        )
+        return dense_leg(r_cfg, models, legs)
 
     if r_type == "hybrid":
-        from src.retrieve.dense_retriever import DenseRetriever
-        from src.retrieve.bm25_retriever import BM25Retriever
         from src.retrieve.hybrid_retriever import HybridRetriever
 
-        dense = DenseRetriever(
-            index_path=r_cfg["faiss_index_path"],
-            store_path=r_cfg["store_path"],
-            model_name=r_cfg["embedding_model"],
-        )
-        bm25 = BM25Retriever(r_cfg["bm25_index_path"])
-
-        return HybridRetriever(
-            dense_retriever=dense,
-            bm25_retriever=bm25,
+        return maybe_route(HybridRetriever(
+            dense_retriever=dense_leg(r_cfg, models, legs),
+            bm25_retriever=bm25_leg(r_cfg, legs),
             alpha=float(r_cfg.get("alpha", 0.5)),
-        )
+        ), r_cfg, calibrate=calibrate_routing)
 
     if r_type == "rrf":
-        from src.retrieve.dense_retriever import DenseRetriever
-        from src.retrieve.bm25_retriever import BM25Retriever
         from src.retrieve.rrf_retriever import RRFRetriever
 
-        dense = DenseRetriever(
-            index_path=r_cfg["faiss_index_path"],
-            store_path=r_cfg["store_path"],
-            model_name=r_cfg["embedding_model"],
-        )
-        bm25 = BM25Retriever(r_cfg["bm25_index_path"])
-
-        return RRFRetriever(
-            retrievers=[dense, bm25],
+        return maybe_route(RRFRetriever(
+            retrievers=[dense_leg(r_cfg, models, legs), bm25_leg(r_cfg, legs)],
             k=int(r_cfg.get("rrf_k", 60)),
+        ), r_cfg, calibrate=calibrate_routing)
+
+    if r_type == "sharded":
+        # Shards built by src/index/build_shards.py; method picks how the shard legs are combined
+        from src.retrieve.sharded_retriever import (
+            ShardCluster, ShardedBM25Retriever, ShardedDenseRetriever,
         )
 
+        backend = r_cfg.get("backend", "process")
+        addresses = r_cfg.get("addresses")
+        key = ("shards", r_cfg["shard_dir"], backend, tuple(addresses or ()))
+        cluster = shared_leg(legs, key, lambda: ShardCluster(
+            shard_dir=r_cfg["shard_dir"],
+            backend=backend,
+            addresses=addresses,
+            authkey=r_cfg.get("authkey"),
+        ))
+        method = str(r_cfg.get("method", "hybrid")).lower()
+
+        if method == "bm25":
+            return ShardedBM25Retriever(cluster)
+        model = shared_model(models, "sentence_transformer", r_cfg.get("embedding_model"))
+        if method == "dense":
+            return ShardedDenseRetriever(cluster, model_name=r_cfg["embedding_model"], model=model)
+
+        dense = ShardedDenseRetriever(cluster, model_name=r_cfg["embedding_model"], model=model)
+        bm25 = ShardedBM25Retriever(cluster)
+        if method == "hybrid":
+            from src.retrieve.hybrid_retriever import HybridRetriever
+            return HybridRetriever(
+                dense_retriever=dense,
+                bm25_retriever=bm25,
+                alpha=float(r_cfg.get("alpha", 0.5)),
+            )
+        if method == "rrf":
+            from src.retrieve.rrf_retriever import RRFRetriever
+            return RRFRetriever(
+                retrievers=[dense, bm25],
+                k=int(r_cfg.get("rrf_k", 60)),
+            )
+        raise ValueError("sharded retrieval.method must be one of: bm25, dense, hybrid, rrf")
+
     raise ValueError(f"Unsupported retrieval.type: {r_type}")
 
 
-def build_reranker(rerank_cfg: dict):
+def load_qrels_qids(path):
+    """qids that appear in a qrels.jsonl"""
+    qids = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                qids.add(str(json.loads(line)["qid"]))
+    return qids
+
+
+def maybe_route(retriever, r_cfg: dict, calibrate: bool = False):
+    """
+    Wrap a hybrid / rrf retriever in query-adaptive leg routing if retrieval.routing.enabled.
+    routing.thresholds: a dict, or a json path written by run_retrieval --calibrate_only;
+    a null threshold disables its route.
+    Calibration (on routing.calibration_queries, restricted to the qids in
+    routing.calibration_qrels, e.g. the train split) only runs when calibrate=True
+    or when no thresholds are configured at all.
+    """
+    routing_cfg = r_cfg.get("routing", {}) or {}
+    if not bool(routing_cfg.get("enabled", False)):
+        return retriever
+
+    from src.retrieve.routed_retriever import RoutedRetriever
+    routed = RoutedRetriever(
+        retriever,
+        recall_budget=float(routing_cfg.get("recall_budget", 0.95)),
+        leg_k=int(routing_cfg.get("leg_k", 200)),
+        shallow_k=int(routing_cfg.get("shallow_k", 50)),
+        overlap_k=int(routing_cfg.get("overlap_k", 10)),
+    )
+
+    thresholds = routing_cfg.get("thresholds")
+    if calibrate or thresholds is None:
+        cal_queries = load_queries(routing_cfg["calibration_queries"])
+        if routing_cfg.get("calibration_qrels"):
+            cal_qids = load_qrels_qids(routing_cfg["calibration_qrels"])
+            cal_queries = [(qid, q) for qid, q in cal_queries if str(qid) in cal_qids]
+        else:
+            print("Warning: routing.calibration_qrels not set; calibrating on all calibration_queries, "
+                  "which may overlap the evaluation queries")
+        cal_size = routing_cfg.get("calibration_size", None)
+        if cal_size is not None:
+            cal_queries = cal_queries[: int(cal_size)]
+        routed.calibrate([q for _, q in cal_queries])
+        print(f"Routing calibrated on {len(cal_queries)} queries: {routed.thresholds}")
+    elif isinstance(thresholds, str):
+        if not os.path.exists(thresholds):
+            raise FileNotFoundError(
+                f"routing.thresholds {thresholds} not found; create it with run_retrieval --calibrate_only"
+            )
+        with open(thresholds, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        routed.set_thresholds(payload["thresholds"])
+        routed.calibration = payload.get("calibration")
+    else:
+        routed.set_thresholds(thresholds)
+
+    return routed
+
+
+def build_reranker(rerank_cfg: dict, doc_texts=None, models=None):
     """
     Cross-encoder reranker.
     Expects src/rerank/cross_encoder_reranker.py to exist.
+    With rerank.pretokenize, doc_texts are tokenized once (or loaded from token_cache_path).
     """
     from src.rerank.cross_encoder_reranker import CrossEncoderReranker
+    pretokenize = bool(rerank_cfg.get("pretokenize", False))
+    model_name = rerank_cfg.get("model_name", "cross-encoder/ms-marco-MiniLM-L-6-v2")
     return CrossEncoderReranker(
-        model_name=rerank_cfg.get("model_name", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+        model_name=model_name,
+        model=shared_model(models, "cross_encoder", model_name),
         batch_size=int(rerank_cfg.get("batch_size", 32)),
+        doc_texts=doc_texts if pretokenize else None,
+        token_cache_path=rerank_cfg.get("token_cache_path") if pretokenize else None,
     )
 
 
+def search_batch(retriever, queries, top_k: int):
+    """Batched search if the retriever supports it, else one search() per query."""
+    if hasattr(retriever, "search_batch"):
+        return retriever.search_batch(queries, top_k=top_k)
+    return [retriever.search(q, top_k=top_k) for q in queries]
+
+
 def minmax_norm(score_map: dict):
     """
     score_map: dict[str,float]
@@ -112,11 +237,91 @@ def minmax_norm(score_map: dict):
     return {k: (v - mn) / (mx - mn) for k, v in score_map.items()}
 
 
+def parse_rerank_params(rerank_cfg: dict, retrieval_top_k: int):
+    """Validate rerank settings -> kwargs for rerank_results."""
+    cand_k = int(rerank_cfg.get("candidate_k", 20))
+    out_k = int(rerank_cfg.get("top_k", 100))
+
+    # mode: "fusion" recommended, "hard" = pure rerank takeover
+    mode = str(rerank_cfg.get("mode", "fusion")).lower()
+    if mode not in ("fusion", "hard"):
+        raise ValueError("rerank.mode must be one of: fusion, hard")
+
+    lam = float(rerank_cfg.get("lambda", 0.2))  # only for fusion
+    use_minmax = bool(rerank_cfg.get("minmax_norm", True))
+
+    if retrieval_top_k < cand_k:
+        raise ValueError(
+            f"retrieval.top_k ({retrieval_top_k}) must be >= rerank.candidate_k ({cand_k})"
+        )
+    if out_k > retrieval_top_k:
+        # not strictly required, but keeps output bounded by retrieved candidates
+        # you can relax this if you want, but usually retrieval_top_k>=out_k is expected
+        raise ValueError(
+            f"rerank.top_k ({out_k}) must be <= retrieval.top_k ({retrieval_top_k})"
+        )
+    return {"cand_k": cand_k, "out_k": out_k, "mode": mode, "lam": lam, "use_minmax": use_minmax}
+
+
+def rerank_results(query, results, reranker, doc_texts, cand_k, out_k, mode, lam, use_minmax):
+    """Rerank the top cand_k of results ("hard" takeover or "fusion" interpolation)."""
+    cand = results[:cand_k]
+
+    # Prepare rerank inputs + keep retrieval scores for fusion
+    docs_for_rerank = []
+    ret_score_map = {}
+    for r in cand:
+        doc_id = r["doc_id"]
+        text = doc_texts.get(doc_id, "")
+        docs_for_rerank.append((doc_id, text))
+        ret_score_map[doc_id] = float(r.get("score", 0.0))
+
+    # Cross-encoder scores for cand
+    reranked = reranker.rerank(query, docs_for_rerank, top_k=cand_k)
+    rr_score_map = {x["doc_id"]: float(x["score"]) for x in reranked}
+
+    if mode == "hard":
+        # Pure rerank takeover within cand, then append the rest
+        reranked_ids = {r["doc_id"] for r in reranked}
+        rest = [r for r in results if r["doc_id"] not in reranked_ids]
+        results = (reranked + rest)[:out_k]
+
+    else:
+        # ---- Fusion rerank (interpolated) ----
+        if use_minmax:
+            ret_norm = minmax_norm(ret_score_map)
+            rr_norm = minmax_norm(rr_score_map)
+        else:
+            ret_norm = ret_score_map
+            rr_norm = rr_score_map
+
+        fused = []
+        for doc_id in ret_score_map.keys():
+            s_ret = ret_norm.get(doc_id, 0.0)
+            s_rr = rr_norm.get(doc_id, 0.0)
+            s = (1.0 - lam) * s_ret + lam * s_rr
+            fused.append({"doc_id": doc_id, "score": float(s)})
+
+        fused.sort(key=lambda x: x["score"], reverse=True)
+
+        fused_ids = {r["doc_id"] for r in fused}
+        rest = [r for r in results if r["doc_id"] not in fused_ids]
+
+        results = (fused + rest)[:out_k]
+        # ---- end Fusion rerank ----
+    return results
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", required=True, help="Path to method yaml config")
     ap.add_argument("--queries", required=True, help="Path to queries.jsonl")
-    ap.add_argument("--out", required=True, help="Output run jsonl path")
+    ap.add_argument("--out", required=False, default=None, help="Output run jsonl path")
+    ap.add_argument(
+        "--calibrate_only",
+        action="store_true",
+        help="Calibrate retrieval.routing and write the thresholds to routing.thresholds (json path), then exit",
+    )
     args = ap.parse_args()
 
     # Load config
@@ -126,8 +331,29 @@ def main():
     r_cfg = cfg["retrieval"]
     r_type = r_cfg["type"].lower()
 
+    if args.calibrate_only:
+        thresholds_path = (r_cfg.get("routing", {}) or {}).get("thresholds")
+        if not isinstance(thresholds_path, str):
+            raise ValueError("--calibrate_only needs retrieval.routing.thresholds set to a json path")
+        retriever = build_retriever(r_cfg, calibrate_routing=True)
+        if not hasattr(retriever, "thresholds"):
+            raise ValueError("--calibrate_only needs a hybrid / rrf config with routing.enabled: true")
+        out_dir = os.path.dirname(thresholds_path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(thresholds_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"thresholds": retriever.thresholds_json(), "calibration": retriever.calibration},
+                f, ensure_ascii=False, indent=2, allow_nan=False,
+            )
+        print(f"Saved routing thresholds to: {thresholds_path}")
+        return
+    if args.out is None:
+        ap.error("--out is required unless --calibrate_only")
+
     # Retrieval settings
     retrieval_top_k = int(r_cfg.get("top_k", 100))
+    batch_size = int(r_cfg.get("batch_size", 1))
 
     # Rerank settings
     rerank_cfg = cfg.get("rerank", {}) or {}
@@ -141,40 +367,15 @@ def main():
     reranker = None
 
     # rerank parameters (only valid if rerank_enabled)
-    cand_k = None
-    out_k = None
-    rerank_mode = None  # "hard" or "fusion"
-    lam = None
-    use_minmax = None
+    rr = {}
 
     if rerank_enabled:
         docs_path = rerank_cfg["docs_path"]
         max_doc_chars = rerank_cfg.get("max_doc_chars", None)  # e.g. 1200
         doc_texts = load_doc_texts(docs_path, max_doc_chars=max_doc_chars)
 
-        reranker = build_reranker(rerank_cfg)
-
-        cand_k = int(rerank_cfg.get("candidate_k", 20))
-        out_k = int(rerank_cfg.get("top_k", 100))
-
-        # mode: "fusion" recommended, "hard" = pure rerank takeover
-        rerank_mode = str(rerank_cfg.get("mode", "fusion")).lower()
-        if rerank_mode not in ("fusion", "hard"):
-            raise ValueError("rerank.mode must be one of: fusion, hard")
-
-        lam = float(rerank_cfg.get("lambda", 0.2))  # only for fusion
-        use_minmax = bool(rerank_cfg.get("minmax_norm", True))
-
-        if retrieval_top_k < cand_k:
-            raise ValueError(
-                f"retrieval.top_k ({retrieval_top_k}) must be >= rerank.candidate_k ({cand_k})"
-            )
-        if out_k > retrieval_top_k:
-            # not strictly required, but keeps output bounded by retrieved candidates
-            # you can relax this if you want, but usually retrieval_top_k>=out_k is expected
-            raise ValueError(
-                f"rerank.top_k ({out_k}) must be <= retrieval.top_k ({retrieval_top_k})"
-            )
+        reranker = build_reranker(rerank_cfg, doc_texts=doc_texts)
+        rr = parse_rerank_params(rerank_cfg, retrieval_top_k)
 
     # Load queries
     queries = load_queries(args.queries)
@@ -186,74 +387,50 @@ def main():
 
     t0 = time.time()
 
-    with open(args.out, "w", encoding="utf-8") as fout:
-        for qid, q in tqdm(
-            queries,
-            desc=f"Retrieving ({r_type}{'+rerank' if rerank_enabled else ''})",
-        ):
-            # 1) retrieve candidates
-            results = retriever.search(q, top_k=retrieval_top_k)
-
-            # 2) optional rerank
-            if rerank_enabled:
-                cand = results[:cand_k]
-
-                # Prepare rerank inputs + keep retrieval scores for fusion
-                docs_for_rerank = []
-                ret_score_map = {}
-                for r in cand:
-                    doc_id = r["doc_id"]
-                    text = doc_texts.get(doc_id, "")
-                    docs_for_rerank.append((doc_id, text))
-                    ret_score_map[doc_id] = float(r.get("score", 0.0))
-
-                # Cross-encoder scores for cand
-                reranked = reranker.rerank(q, docs_for_rerank, top_k=cand_k)
-                rr_score_map = {x["doc_id"]: float(x["score"]) for x in reranked}
-
-                if rerank_mode == "hard":
-                    # Pure rerank takeover within cand, then append the rest
-                    reranked_ids = {r["doc_id"] for r in reranked}
-                    rest = [r for r in results if r["doc_id"] not in reranked_ids]
-                    results = (reranked + rest)[:out_k]
-
-                else:
-                    # ---- Fusion rerank (interpolated) ----
-                    if use_minmax:
-                        ret_norm = minmax_norm(ret_score_map)
-                        rr_norm = minmax_norm(rr_score_map)
-                    else:
-                        ret_norm = ret_score_map
-                        rr_norm = rr_score_map
-
-                    fused = []
-                    for doc_id in ret_score_map.keys():
-                        s_ret = ret_norm.get(doc_id, 0.0)
-                        s_rr = rr_norm.get(doc_id, 0.0)
-                        s = (1.0 - lam) * s_ret + lam * s_rr
-                        fused.append({"doc_id": doc_id, "score": float(s)})
-
-                    fused.sort(key=lambda x: x["score"], reverse=True)
-
-                    fused_ids = {r["doc_id"] for r in fused}
-                    rest = [r for r in results if r["doc_id"] not in fused_ids]
-
-                    results = (fused + rest)[:out_k]
-                    # ---- end Fusion rerank ----
-
-            # 3) write run line (always)
-            fout.write(json.dumps({"qid": qid, "results": results}, ensure_ascii=False) + "\n")
+    with open(args.out, "w", encoding="utf-8") as fout, tqdm(
+        total=len(queries),
+        desc=f"Retrieving ({r_type}{'+rerank' if rerank_enabled else ''})",
+    ) as pbar:
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+
+            # 1) retrieve candidates (one fan-out per batch for retrievers with search_batch)
+            batch_results = search_batch(retriever, [q for _, q in batch], top_k=retrieval_top_k)
+
+            for (qid, q), results in zip(batch, batch_results):
+                # 2) optional rerank
+                if rerank_enabled:
+                    results = rerank_results(q, results, reranker, doc_texts, **rr)
+
+                # 3) write run line (always)
+                fout.write(json.dumps({"qid": qid, "results": results}, ensure_ascii=False) + "\n")
+            pbar.update(len(batch))
 
     t1 = time.time()
 
+    if hasattr(retriever, "routing_summary"):
+        routing_path = os.path.splitext(args.out)[0] + ".routing.json"
+        summary = retriever.routing_summary()
+        with open(routing_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2, allow_nan=False)
+        print(
+            f"Routing: legs_skipped_frac={summary['legs_skipped_frac']:.3f}, "
+            f"routes={summary['route_counts']}, mean_latency_ms={summary['mean_latency_ms']:.2f}"
+        )
+        print(f"Saved routing stats to: {routing_path}")
+
     print(f"Saved run to: {args.out}")
     print(f"Total queries: {len(queries)}")
     print(f"Elapsed: {t1 - t0:.2f}s")
     if rerank_enabled:
         print(
-            f"Rerank enabled: mode={rerank_mode}, candidate_k={cand_k}, out_k={out_k}, "
-            f"lambda={lam if rerank_mode=='fusion' else 'N/A'}, "
-            f"minmax_norm={use_minmax}, max_doc_chars={rerank_cfg.get('max_doc_chars', None)}"
+            f"Rerank enabled: mode={rr['mode']}, candidate_k={rr['cand_k']}, out_k={rr['out_k']}, "
+            f"lambda={rr['lam'] if rr['mode']=='fusion' else 'N/A'}, "
+            f"minmax_norm={rr['use_minmax']}, max_doc_chars={rerank_cfg.get('max_doc_chars', None)}"
+        )
+        print(
+            f"Rerank time: tokenize={reranker.tokenize_time:.2f}s, forward={reranker.forward_time:.2f}s, "
+            f"pretokenize={reranker.pretokenized}"
         )
 
 
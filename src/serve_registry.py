@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import argparse
+import yaml
+from tqdm import tqdm
+
+from src.common.registry import IndexRegistry
+
+
+def load_requests(path):
+    """requests.jsonl lines: {"qid": ..., "dataset": ..., "query": ..., optional "method": ...}"""
+    requests = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            requests.append(json.loads(line))
+    return requests
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--configs", nargs="+", required=True, help="Method yaml configs (any number per dataset)")
+    ap.add_argument(
+        "--requests",
+        required=True,
+        help="jsonl with qid, dataset, query (+ optional method = config file stem) per line",
+    )
+    ap.add_argument("--out", required=True, help="Output run jsonl path")
+    ap.add_argument(
+        "--memory_budget_mb",
+        type=float,
+        default=None,
+        help="Max measured in-memory size of loaded indexes / doc texts / token caches (models excluded); "
+        "least recently used ones are evicted (default: no limit)",
+    )
+    args = ap.parse_args()
+
+    # configs are named by file stem; a request's optional "method" picks one by that name
+    configs = {}
+    for path in args.configs:
+        with open(path, "r", encoding="utf-8") as f:
+            configs[os.path.splitext(os.path.basename(path))[0]] = yaml.safe_load(f)
+
+    registry = IndexRegistry(configs, memory_budget_mb=args.memory_budget_mb)
+    requests = load_requests(args.requests)
+
+    out_dir = os.path.dirname(args.out)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    t0 = time.time()
+
+    with open(args.out, "w", encoding="utf-8") as fout:
+        for req in tqdm(requests, desc="Serving"):
+            results = registry.search(req)
+            fout.write(json.dumps(
+                {
+                    "qid": req["qid"],
+                    "dataset": req["dataset"],
+                    "method": registry.resolve(req["dataset"], req.get("method")),
+                    "results": results,
+                },
+                ensure_ascii=False,
+            ) + "\n")
+
+    t1 = time.time()
+
+    print(f"Saved run to: {args.out}")
+    print(f"Total requests: {len(requests)}")
+    print(f"Elapsed: {t1 - t0:.2f}s")
+    print(f"Registry: {registry.summary()}")
+
+
+if __name__ == "__main__":
+    main()